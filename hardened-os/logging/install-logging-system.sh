@@ -61,7 +61,7 @@ check_requirements() {
     fi
     
     # Install Python dependencies for log server
-    pip3 install aiohttp aiofiles cryptography
+    pip3 install aiohttp cryptography blake3 orjson uvloop
     
     log_info "System requirements satisfied"
 }
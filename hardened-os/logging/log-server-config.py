@@ -5,22 +5,47 @@ from hardened OS clients with cryptographic integrity verification.
 """
 
 import asyncio
+import base64
+import binascii
+import concurrent.futures
+import functools
 import json
 import logging
+import mmap
+import multiprocessing
 import ssl
+import struct
+import sys
+import tempfile
 import hashlib
 import hmac
+import os
 import time
+from array import array
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Callable, List, Optional
 from aiohttp import web, ClientSession
-import aiofiles
 import cryptography.hazmat.primitives.hashes as hashes
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.asymmetric import rsa, padding, utils
 from cryptography.exceptions import InvalidSignature
 
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -28,6 +53,292 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Size of the chunks streamed from uploads to disk and the hashers
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Upper bound on integrity entries committed by a single WAL fsync
+INTEGRITY_COMMIT_MAX_BATCH = 1024
+
+# Binary integrity WAL: a header (magic, generation) followed by records
+# of a fixed header (timestamp, size, hash algorithm, digest, client id
+# length, filename length) and the UTF-8 client id and filename
+INTEGRITY_WAL_MAGIC = b'HOSIWAL2'
+INTEGRITY_WAL_HEADER = struct.Struct('<8sQ')
+INTEGRITY_WAL_RECORD = struct.Struct('<dqB32sHH')
+HASH_ALGORITHM_CODES = {'sha256': 0, 'blake3': 1}
+HASH_ALGORITHM_NAMES = {code: name for name, code in HASH_ALGORITHM_CODES.items()}
+
+# Directory holding client public keys (<client_id>.pub)
+CLIENT_KEYS_DIR = "/etc/log-server/client-keys"
+
+# Verifiers loaded once in each signature verification worker process
+_worker_verifiers: Dict[str, Callable[[bytes, bytes], None]] = {}
+
+def _json_dumps(obj: Any, indent: bool = False) -> bytes:
+    """Serialize an object to JSON bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None).encode('utf-8')
+
+def _json_loads(data: bytes) -> Any:
+    """Deserialize JSON bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _write_all(fd: int, data: bytes):
+    """Write all of data to fd, retrying on partial writes."""
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+def _fsync_directory(path: Path):
+    """Make renames within a directory durable."""
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def cpu_has_sha_ni() -> bool:
+    """Check whether the CPU advertises the Intel SHA extensions."""
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                if line.startswith('flags'):
+                    return 'sha_ni' in line.split()
+    except OSError:
+        pass
+    return False
+
+def select_sha256_backend():
+    """Select the fastest available SHA-256 constructor.
+
+    OpenSSL dispatches to SHA-NI at runtime when the CPU supports it, so the
+    OpenSSL-backed constructor is preferred over the builtin fallback.
+    """
+    if hashlib.sha256.__name__.startswith('openssl_'):
+        backend = f"{ssl.OPENSSL_VERSION} ({'SHA-NI' if cpu_has_sha_ni() else 'generic'})"
+        return hashlib.sha256, backend
+    
+    return hashlib.sha256, "builtin"
+
+def load_client_verifiers(keys_dir: str) -> Dict[str, Callable[[bytes, bytes], None]]:
+    """Load client verification keys as precomputed verifiers."""
+    verifiers = {}
+    keys_path = Path(keys_dir)
+    
+    # Signature parameters shared by every client verifier
+    pss = padding.PSS(
+        mgf=padding.MGF1(hashes.SHA256()),
+        salt_length=padding.PSS.MAX_LENGTH
+    )
+    sha256_alg = utils.Prehashed(hashes.SHA256())
+    
+    if keys_path.exists():
+        for key_file in keys_path.glob("*.pub"):
+            client_id = key_file.stem
+            try:
+                with open(key_file, 'rb') as f:
+                    public_key = serialization.load_pem_public_key(f.read())
+                    verifiers[client_id] = functools.partial(
+                        public_key.verify,
+                        padding=pss,
+                        algorithm=sha256_alg
+                    )
+                    logger.info(f"Loaded verification key for client: {client_id}")
+            except Exception as e:
+                logger.error(f"Failed to load key for {client_id}: {e}")
+    
+    return verifiers
+
+def verify_log_signature(verifiers: Dict[str, Callable[[bytes, bytes], None]],
+                         client_id: str, log_digest: bytes, signature: bytes) -> bool:
+    """Verify cryptographic signature of log data from its SHA-256 digest."""
+    verifier = verifiers.get(client_id)
+    if verifier is None:
+        logger.error(f"No verification key found for client: {client_id}")
+        return False
+    
+    try:
+        verifier(signature, log_digest)
+        return True
+    except InvalidSignature:
+        logger.error(f"Invalid signature from client: {client_id}")
+        return False
+    except Exception as e:
+        logger.error(f"Signature verification error for {client_id}: {e}")
+        return False
+
+def _init_verify_worker(keys_dir: str):
+    """Load client verifiers once per verification worker process."""
+    global _worker_verifiers
+    _worker_verifiers = load_client_verifiers(keys_dir)
+
+def _verify_worker(client_id: str, log_digest: bytes, signature: bytes) -> bool:
+    """Verify a log signature inside a verification worker process."""
+    return verify_log_signature(_worker_verifiers, client_id, log_digest, signature)
+
+class MerkleTree:
+    """Append-only RFC 6962 Merkle tree over per-upload digests.
+    
+    Only nodes of complete subtrees are stored, one packed buffer per level,
+    so appends and root/proof computation touch O(log n) nodes.
+    """
+    
+    NODE_SIZE = 32
+    
+    def __init__(self):
+        self.levels: List[bytearray] = [bytearray()]
+        self.size = 0
+    
+    @staticmethod
+    def leaf_hash(digest: bytes) -> bytes:
+        return hashlib.sha256(b'\x00' + digest).digest()
+    
+    @staticmethod
+    def node_hash(left: bytes, right: bytes) -> bytes:
+        return hashlib.sha256(b'\x01' + left + right).digest()
+    
+    def _node(self, level: int, index: int) -> bytes:
+        offset = index * self.NODE_SIZE
+        return bytes(self.levels[level][offset:offset + self.NODE_SIZE])
+    
+    def append(self, digest: bytes):
+        """Append a leaf, materialising every subtree it completes."""
+        node = self.leaf_hash(digest)
+        self.levels[0] += node
+        index = self.size
+        level = 0
+        
+        while index & 1:
+            node = self.node_hash(self._node(level, index - 1), node)
+            level += 1
+            index >>= 1
+            if level == len(self.levels):
+                self.levels.append(bytearray())
+            self.levels[level] += node
+        
+        self.size += 1
+    
+    def _subtree_hash(self, start: int, size: int) -> bytes:
+        """Hash of leaves [start, start + size) per RFC 6962."""
+        if size & (size - 1) == 0:
+            level = size.bit_length() - 1
+            return self._node(level, start >> level)
+        
+        split = 1 << ((size - 1).bit_length() - 1)
+        return self.node_hash(
+            self._subtree_hash(start, split),
+            self._subtree_hash(start + split, size - split)
+        )
+    
+    def root(self) -> Optional[bytes]:
+        """Current tree head, or None for an empty tree."""
+        if not self.size:
+            return None
+        return self._subtree_hash(0, self.size)
+    
+    def inclusion_proof(self, index: int) -> List[bytes]:
+        """Audit path for a leaf, ordered from the leaf up to the root."""
+        if not 0 <= index < self.size:
+            raise ValueError("Leaf index out of range")
+        
+        proof = []
+        start, size = 0, self.size
+        while size > 1:
+            split = 1 << ((size - 1).bit_length() - 1)
+            if index - start < split:
+                proof.append(self._subtree_hash(start + split, size - split))
+                size = split
+            else:
+                proof.append(self._subtree_hash(start, split))
+                start += split
+                size -= split
+        
+        proof.reverse()
+        return proof
+
+class ClientIntegrityChain:
+    """Integrity entries for one client, stored column-wise."""
+    
+    DIGEST_SIZE = 32
+    
+    def __init__(self):
+        self.timestamps = array('d')
+        self.sizes = array('q')
+        self.digests = bytearray()
+        self.hash_algorithms: List[str] = []
+        self.filenames: List[str] = []
+        self.merkle = MerkleTree()
+    
+    def __len__(self) -> int:
+        return len(self.timestamps)
+    
+    def append(self, entry: Dict[str, Any]):
+        """Append an integrity entry."""
+        self.append_fields(
+            entry['timestamp'],
+            entry['size'],
+            bytes.fromhex(entry['hash']),
+            entry.get('hash_algorithm', 'sha256'),
+            entry['filename']
+        )
+    
+    def append_fields(self, timestamp: float, size: int, digest: bytes,
+                      hash_algorithm: str, filename: str):
+        """Append an integrity entry from its decoded fields."""
+        self.timestamps.append(timestamp)
+        self.sizes.append(size)
+        self.digests += digest
+        self.merkle.append(digest)
+        self.hash_algorithms.append(sys.intern(hash_algorithm))
+        self.filenames.append(filename)
+    
+    def hash_at(self, index: int) -> str:
+        """Return the hex digest of a single entry."""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Integrity entry index out of range")
+        
+        offset = index * self.DIGEST_SIZE
+        return self.digests[offset:offset + self.DIGEST_SIZE].hex()
+    
+    def hashes(self, start: int = 0) -> List[str]:
+        """Return hex digests from entry index start onwards."""
+        start = max(len(self) + start, 0) if start < 0 else start
+        size = self.DIGEST_SIZE
+        return [
+            self.digests[offset:offset + size].hex()
+            for offset in range(start * size, len(self.digests), size)
+        ]
+    
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Convert the chain back to a list of entry dicts."""
+        return [
+            {
+                'timestamp': timestamp,
+                'hash': digest,
+                'hash_algorithm': hash_algorithm,
+                'filename': filename,
+                'size': size
+            }
+            for timestamp, digest, hash_algorithm, filename, size in zip(
+                self.timestamps, self.hashes(), self.hash_algorithms,
+                self.filenames, self.sizes
+            )
+        ]
+    
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> 'ClientIntegrityChain':
+        """Build a chain from a list of entry dicts."""
+        chain = cls()
+        for record in records:
+            chain.append(record)
+        return chain
+
 class SecureLogServer:
     """Secure log server with integrity verification and tamper detection."""
     
@@ -36,18 +347,47 @@ class SecureLogServer:
         self.storage_path = Path(self.config['storage_path'])
         self.storage_path.mkdir(parents=True, exist_ok=True)
         
+        # Select SHA-256 implementation
+        self._sha256, sha256_backend = select_sha256_backend()
+        logger.info(f"Using SHA-256 backend: {sha256_backend}")
+        
+        # Integrity-chain digests are never signed, so prefer BLAKE3
+        self.log_hash_algorithm = 'blake3' if blake3 is not None else 'sha256'
+        logger.info(f"Using {self.log_hash_algorithm} for integrity-chain digests")
+        
         # Load verification keys
-        self.verification_keys = self._load_verification_keys()
+        self.verifiers = load_client_verifiers(CLIENT_KEYS_DIR)
+        
+        # RSA verification is CPU-bound, so run it in worker processes
+        verify_workers = self.config.get('verify_workers', os.cpu_count())
+        self.verify_pool = None
+        if verify_workers:
+            self.verify_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=verify_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_verify_worker,
+                initargs=(CLIENT_KEYS_DIR,)
+            )
         
-        # Initialize integrity database
+        # Initialize integrity database (snapshot plus append-only WAL)
+        self.integrity_db_path = self.storage_path / "integrity.db"
+        self.integrity_wal_path = self.storage_path / "integrity.wal"
         self.integrity_db = {}
+        # Generation of the WAL that follows the snapshot; older WALs are
+        # already covered by it
+        self.integrity_wal_generation = 0
+        self._integrity_wal_reset_pending = False
         self._load_integrity_db()
+        
+        # Group-commit queue for integrity entries (created by start_server)
+        self._integrity_queue = None
+        self._integrity_lock = None
     
     def _load_config(self, config_path: str) -> Dict[str, Any]:
         """Load server configuration."""
         try:
-            with open(config_path, 'r') as f:
-                return json.load(f)
+            with open(config_path, 'rb') as f:
+                return _json_loads(f.read())
         except FileNotFoundError:
             # Default configuration
             return {
@@ -58,95 +398,263 @@ class SecureLogServer:
                 'key_file': '/etc/ssl/private/log-server.key',
                 'ca_file': '/etc/ssl/certs/ca.crt',
                 'max_log_size': 100 * 1024 * 1024,  # 100MB
-                'retention_days': 90
+                'retention_days': 90,
+                'integrity_compaction_interval': 600,  # seconds
+                'verify_workers': os.cpu_count()
             }
     
-    def _load_verification_keys(self) -> Dict[str, Any]:
-        """Load client verification keys."""
-        keys = {}
-        keys_dir = Path("/etc/log-server/client-keys")
-        
-        if keys_dir.exists():
-            for key_file in keys_dir.glob("*.pub"):
-                client_id = key_file.stem
-                try:
-                    with open(key_file, 'rb') as f:
-                        public_key = serialization.load_pem_public_key(f.read())
-                        keys[client_id] = public_key
-                        logger.info(f"Loaded verification key for client: {client_id}")
-                except Exception as e:
-                    logger.error(f"Failed to load key for {client_id}: {e}")
-        
-        return keys
+    def _client_chain(self, client_id: str) -> ClientIntegrityChain:
+        """Get or create the integrity chain for a client."""
+        chain = self.integrity_db.get(client_id)
+        if chain is None:
+            chain = self.integrity_db[client_id] = ClientIntegrityChain()
+        return chain
     
     def _load_integrity_db(self):
-        """Load integrity database from disk."""
-        db_path = self.storage_path / "integrity.db"
-        if db_path.exists():
+        """Load integrity database snapshot and replay the WAL."""
+        if self.integrity_db_path.exists():
             try:
-                with open(db_path, 'r') as f:
-                    self.integrity_db = json.load(f)
+                with open(self.integrity_db_path, 'rb') as f:
+                    snapshot = _json_loads(f.read())
+                if isinstance(snapshot.get('clients'), dict):
+                    self.integrity_wal_generation = snapshot['wal_generation']
+                    snapshot = snapshot['clients']
+                self.integrity_db = {
+                    client_id: ClientIntegrityChain.from_records(records)
+                    for client_id, records in snapshot.items()
+                }
             except Exception as e:
                 logger.error(f"Failed to load integrity database: {e}")
                 self.integrity_db = {}
+        
+        if self.integrity_wal_path.exists():
+            try:
+                self._replay_integrity_wal()
+            except Exception as e:
+                # Never append to or compact over a WAL that could not be read
+                corrupt_path = self.integrity_wal_path.with_name(
+                    f"integrity.wal.corrupt.{int(time.time())}"
+                )
+                logger.error(f"Failed to replay integrity WAL, moving it to {corrupt_path}: {e}")
+                os.rename(self.integrity_wal_path, corrupt_path)
+    
+    def _replay_integrity_wal(self):
+        """Replay WAL records on top of the loaded snapshot."""
+        with open(self.integrity_wal_path, 'r+b') as f:
+            wal_size = os.fstat(f.fileno()).st_size
+            if not wal_size:
+                return
+            
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, 'madvise'):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                
+                magic = mm[:len(INTEGRITY_WAL_MAGIC)]
+                if wal_size < INTEGRITY_WAL_HEADER.size and INTEGRITY_WAL_MAGIC.startswith(magic):
+                    # Header torn while creating the WAL; no record was committed
+                    offset = 0
+                elif magic != INTEGRITY_WAL_MAGIC:
+                    raise ValueError("unrecognized integrity WAL header")
+                else:
+                    _, generation = INTEGRITY_WAL_HEADER.unpack_from(mm)
+                    if generation < self.integrity_wal_generation:
+                        # Compaction stopped after writing the snapshot
+                        logger.warning("Skipping integrity WAL already covered by the snapshot")
+                        self._integrity_wal_reset_pending = True
+                        return
+                    offset = self._replay_integrity_records(mm, INTEGRITY_WAL_HEADER.size, wal_size)
+            
+            if offset != wal_size:
+                # Drop a torn write at the tail so later appends stay aligned
+                logger.warning("Truncating incomplete integrity WAL record")
+                f.truncate(offset)
+    
+    def _replay_integrity_records(self, mm: mmap.mmap, offset: int, wal_size: int) -> int:
+        """Replay binary WAL records, returning the offset after the last whole one."""
+        unpack_record = INTEGRITY_WAL_RECORD.unpack_from
+        header_size = INTEGRITY_WAL_RECORD.size
+        
+        while offset + header_size <= wal_size:
+            timestamp, size, algorithm, digest, client_len, filename_len = \
+                unpack_record(mm, offset)
+            end = offset + header_size + client_len + filename_len
+            if end > wal_size:
+                break
+            
+            client_start = offset + header_size
+            client_id = mm[client_start:client_start + client_len].decode('utf-8')
+            filename = mm[client_start + client_len:end].decode('utf-8')
+            self._client_chain(client_id).append_fields(
+                timestamp, size, digest, HASH_ALGORITHM_NAMES[algorithm], filename
+            )
+            offset = end
+        
+        return offset
+    
+    @staticmethod
+    def _encode_integrity_record(client_id: str, entry: Dict[str, Any]) -> bytes:
+        """Encode an integrity entry as a binary WAL record."""
+        client = client_id.encode('utf-8')
+        filename = entry['filename'].encode('utf-8')
+        return INTEGRITY_WAL_RECORD.pack(
+            entry['timestamp'],
+            entry['size'],
+            HASH_ALGORITHM_CODES[entry['hash_algorithm']],
+            bytes.fromhex(entry['hash']),
+            len(client),
+            len(filename)
+        ) + client + filename
+    
+    def _integrity_wal_header(self) -> bytes:
+        """Serialize the WAL header for the current generation."""
+        return INTEGRITY_WAL_HEADER.pack(INTEGRITY_WAL_MAGIC, self.integrity_wal_generation)
+    
+    def _reset_integrity_wal(self):
+        """Atomically replace the WAL with an empty one of the current generation."""
+        tmp_path = self.integrity_wal_path.with_name("integrity.wal.new")
+        with open(tmp_path, 'wb') as f:
+            f.write(self._integrity_wal_header())
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, self.integrity_wal_path)
+        _fsync_directory(self.storage_path)
+        self._integrity_wal_reset_pending = False
+    
+    def _write_integrity_records(self, records: bytes):
+        """Durably append a batch of serialized records to the WAL."""
+        if self._integrity_wal_reset_pending:
+            # Records appended to an older generation would be skipped on replay
+            self._reset_integrity_wal()
+        with open(self.integrity_wal_path, 'ab') as f:
+            if f.tell() == 0:
+                f.write(self._integrity_wal_header())
+            f.write(records)
+            f.flush()
+            os.fsync(f.fileno())
+    
+    async def _commit_integrity_entry(self, client_id: str, entry: Dict[str, Any]):
+        """Queue an integrity entry and wait until it is durable."""
+        committed = asyncio.get_running_loop().create_future()
+        await self._integrity_queue.put((client_id, entry, committed))
+        await committed
+    
+    async def _integrity_writer(self):
+        """Group-commit queued integrity entries with a single fsync per batch."""
+        loop = asyncio.get_running_loop()
+        queue = self._integrity_queue
+        
+        while True:
+            # Entries queued while the previous batch was syncing form the next batch
+            batch = [await queue.get()]
+            while len(batch) < INTEGRITY_COMMIT_MAX_BATCH and not queue.empty():
+                batch.append(queue.get_nowait())
+            
+            records = b''.join(
+                self._encode_integrity_record(client_id, entry)
+                for client_id, entry, _ in batch
+            )
+            
+            async with self._integrity_lock:
+                try:
+                    await loop.run_in_executor(None, self._write_integrity_records, records)
+                except Exception as e:
+                    logger.error(f"Failed to append integrity WAL: {e}")
+                    for _, _, committed in batch:
+                        if not committed.done():
+                            committed.set_exception(e)
+                    continue
+                
+                for client_id, entry, committed in batch:
+                    self._client_chain(client_id).append(entry)
+                    if not committed.done():
+                        committed.set_result(None)
     
-    def _save_integrity_db(self):
-        """Save integrity database to disk."""
-        db_path = self.storage_path / "integrity.db"
+    def _compact_integrity_db(self):
+        """Write a fresh integrity database snapshot and reset the WAL.
+        
+        The snapshot names the WAL generation that follows it, so a crash
+        before the WAL is reset cannot replay its records twice.
+        """
+        generation = self.integrity_wal_generation + 1
+        tmp_path = self.integrity_db_path.with_name("integrity.db.new")
         try:
-            with open(db_path, 'w') as f:
-                json.dump(self.integrity_db, f, indent=2)
+            with open(tmp_path, 'wb') as f:
+                snapshot = {
+                    'wal_generation': generation,
+                    'clients': {
+                        client_id: chain.to_records()
+                        for client_id, chain in self.integrity_db.items()
+                    }
+                }
+                f.write(_json_dumps(snapshot, indent=True))
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(tmp_path, self.integrity_db_path)
+            _fsync_directory(self.storage_path)
         except Exception as e:
-            logger.error(f"Failed to save integrity database: {e}")
-    
-    def _verify_log_signature(self, client_id: str, log_data: bytes, signature: bytes) -> bool:
-        """Verify cryptographic signature of log data."""
-        if client_id not in self.verification_keys:
-            logger.error(f"No verification key found for client: {client_id}")
-            return False
+            logger.error(f"Failed to compact integrity database: {e}")
+            return
         
+        # Every WAL record is now covered by the snapshot
+        self.integrity_wal_generation = generation
+        self._integrity_wal_reset_pending = True
         try:
-            public_key = self.verification_keys[client_id]
-            public_key.verify(
-                signature,
-                log_data,
-                padding.PSS(
-                    mgf=padding.MGF1(hashes.SHA256()),
-                    salt_length=padding.PSS.MAX_LENGTH
-                ),
-                hashes.SHA256()
-            )
-            return True
-        except InvalidSignature:
-            logger.error(f"Invalid signature from client: {client_id}")
-            return False
+            self._reset_integrity_wal()
         except Exception as e:
-            logger.error(f"Signature verification error for {client_id}: {e}")
-            return False
+            # Retried before the next WAL append
+            logger.error(f"Failed to reset integrity WAL: {e}")
+    
+    async def _integrity_compaction_loop(self):
+        """Periodically compact the integrity WAL into a snapshot."""
+        loop = asyncio.get_running_loop()
+        interval = self.config.get('integrity_compaction_interval', 600)
+        while True:
+            await asyncio.sleep(interval)
+            async with self._integrity_lock:
+                # Serializing and fsyncing the snapshot must not stall connections
+                await loop.run_in_executor(None, self._compact_integrity_db)
+    
+    async def _verify_log_signature(self, client_id: str, log_digest: bytes, signature: bytes) -> bool:
+        """Verify cryptographic signature of log data off the event loop."""
+        if self.verify_pool is None:
+            return verify_log_signature(self.verifiers, client_id, log_digest, signature)
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.verify_pool, _verify_worker, client_id, log_digest, signature
+        )
+    
+    def _new_log_hasher(self):
+        """Create an incremental integrity-chain hasher."""
+        if blake3 is None:
+            return self._sha256()
+        return blake3.blake3()
     
     def _calculate_log_hash(self, log_data: bytes) -> str:
-        """Calculate SHA-256 hash of log data."""
-        return hashlib.sha256(log_data).hexdigest()
+        """Calculate integrity-chain digest of log data."""
+        if blake3 is None:
+            return self._sha256(log_data).hexdigest()
+        return blake3.blake3(log_data).hexdigest()
     
     def _detect_tampering(self, client_id: str, log_hash: str, timestamp: float) -> bool:
         """Detect potential log tampering based on hash chain."""
-        client_chain = self.integrity_db.get(client_id, [])
+        client_chain = self.integrity_db.get(client_id)
         
         if not client_chain:
             # First log from this client
             return False
         
-        last_entry = client_chain[-1]
+        last_timestamp = client_chain.timestamps[-1]
         
         # Check for timestamp anomalies
-        if timestamp < last_entry['timestamp']:
-            logger.warning(f"Timestamp anomaly detected for {client_id}: {timestamp} < {last_entry['timestamp']}")
+        if timestamp < last_timestamp:
+            logger.warning(f"Timestamp anomaly detected for {client_id}: {timestamp} < {last_timestamp}")
             return True
         
         # Check for hash chain integrity (simplified)
-        expected_chain_hash = hashlib.sha256(
-            (last_entry['hash'] + log_hash).encode()
-        ).hexdigest()
+        expected_chain_hash = self._calculate_log_hash(
+            (client_chain.hash_at(-1) + log_hash).encode()
+        )
         
         return False  # Simplified - implement full hash chain verification
     
@@ -160,54 +668,90 @@ class SecureLogServer:
             
             client_id = peercert.get('subject', {}).get('commonName', 'unknown')
             
-            # Read log data
-            log_data = await request.read()
-            
-            # Extract signature from headers
+            # Extract signature from headers (base64 preferred, hex accepted)
+            signature_b64 = request.headers.get('X-Log-Signature-B64')
             signature_header = request.headers.get('X-Log-Signature')
-            if not signature_header:
+            if not signature_b64 and not signature_header:
                 return web.Response(status=400, text="Missing log signature")
             
             try:
-                signature = bytes.fromhex(signature_header)
-            except ValueError:
+                if signature_b64:
+                    signature = base64.b64decode(signature_b64, validate=True)
+                else:
+                    signature = bytes.fromhex(signature_header)
+            except (ValueError, binascii.Error):
                 return web.Response(status=400, text="Invalid signature format")
             
-            # Verify signature
-            if not self._verify_log_signature(client_id, log_data, signature):
-                logger.error(f"Signature verification failed for client: {client_id}")
-                return web.Response(status=403, text="Signature verification failed")
+            max_log_size = self.config['max_log_size']
+            if request.content_length is not None and request.content_length > max_log_size:
+                return web.Response(status=413, text="Log too large")
             
-            # Calculate log hash
-            log_hash = self._calculate_log_hash(log_data)
-            timestamp = time.time()
+            log_dir = self.storage_path / client_id
+            log_dir.mkdir(parents=True, exist_ok=True)
             
-            # Detect tampering
-            if self._detect_tampering(client_id, log_hash, timestamp):
-                logger.critical(f"TAMPERING DETECTED for client: {client_id}")
-                # Send alert (implement notification mechanism)
-                return web.Response(status=409, text="Tampering detected")
+            # Concurrent uploads from one client get distinct partial files;
+            # the final name keeps the random part mkstemp chose
+            fd, partial_name = tempfile.mkstemp(
+                prefix=f"{client_id}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_",
+                suffix='.log.part',
+                dir=log_dir
+            )
+            partial_path = Path(partial_name)
+            log_filename = partial_path.name[:-len('.part')]
+            log_path = partial_path.with_name(log_filename)
             
-            # Store log data
-            log_filename = f"{client_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
-            log_path = self.storage_path / client_id / log_filename
-            log_path.parent.mkdir(parents=True, exist_ok=True)
+            # Stream log data to disk, hashing each chunk as it arrives
+            signed_hasher = self._sha256()
+            log_hasher = self._new_log_hasher()
+            log_size = 0
+            stored = False
             
-            async with aiofiles.open(log_path, 'wb') as f:
-                await f.write(log_data)
+            try:
+                # Chunks are small, so plain blocking writes are cheaper
+                # than a thread-pool round trip per chunk
+                try:
+                    os.fchmod(fd, 0o640)
+                    async for chunk in request.content.iter_chunked(UPLOAD_CHUNK_SIZE):
+                        log_size += len(chunk)
+                        if log_size > max_log_size:
+                            return web.Response(status=413, text="Log too large")
+                        
+                        signed_hasher.update(chunk)
+                        log_hasher.update(chunk)
+                        _write_all(fd, chunk)
+                finally:
+                    os.close(fd)
+                
+                # Verify signature
+                if not await self._verify_log_signature(client_id, signed_hasher.digest(), signature):
+                    logger.error(f"Signature verification failed for client: {client_id}")
+                    return web.Response(status=403, text="Signature verification failed")
+                
+                log_hash = log_hasher.hexdigest()
+                timestamp = time.time()
+                
+                # Detect tampering
+                if self._detect_tampering(client_id, log_hash, timestamp):
+                    logger.critical(f"TAMPERING DETECTED for client: {client_id}")
+                    # Send alert (implement notification mechanism)
+                    return web.Response(status=409, text="Tampering detected")
+                
+                partial_path.rename(log_path)
+                stored = True
+            finally:
+                if not stored:
+                    partial_path.unlink(missing_ok=True)
             
             # Update integrity database
-            if client_id not in self.integrity_db:
-                self.integrity_db[client_id] = []
-            
-            self.integrity_db[client_id].append({
+            entry = {
                 'timestamp': timestamp,
                 'hash': log_hash,
+                'hash_algorithm': self.log_hash_algorithm,
                 'filename': log_filename,
-                'size': len(log_data)
-            })
+                'size': log_size
+            }
             
-            self._save_integrity_db()
+            await self._commit_integrity_entry(client_id, entry)
             
             logger.info(f"Log received and verified from {client_id}: {log_filename}")
             return web.Response(status=200, text="Log received and verified")
@@ -223,17 +767,40 @@ class SecureLogServer:
             if not client_id:
                 return web.Response(status=400, text="Missing client_id parameter")
             
-            client_chain = self.integrity_db.get(client_id, [])
+            client_chain = self.integrity_db.get(client_id) or ClientIntegrityChain()
+            merkle_root = client_chain.merkle.root()
             
             integrity_report = {
                 'client_id': client_id,
                 'total_logs': len(client_chain),
-                'last_update': client_chain[-1]['timestamp'] if client_chain else None,
+                'last_update': client_chain.timestamps[-1] if client_chain else None,
                 'integrity_status': 'verified',
-                'hash_chain': [entry['hash'] for entry in client_chain[-10:]]  # Last 10 hashes
+                'hash_chain': client_chain.hashes(-10),  # Last 10 hashes
+                # Older entries are SHA-256, newer ones may be BLAKE3
+                'hash_chain_algorithms': client_chain.hash_algorithms[-10:],
+                'tree_size': client_chain.merkle.size,
+                'merkle_root': merkle_root.hex() if merkle_root else None
             }
             
-            return web.json_response(integrity_report)
+            # Inclusion proof for a single upload, verifiable in O(log n)
+            index_param = request.query.get('index')
+            if index_param is not None:
+                try:
+                    index = int(index_param)
+                    proof = client_chain.merkle.inclusion_proof(index)
+                except ValueError:
+                    return web.Response(status=400, text="Invalid index parameter")
+                
+                integrity_report['leaf_index'] = index
+                integrity_report['leaf'] = client_chain.hash_at(index)
+                integrity_report['leaf_hash_algorithm'] = client_chain.hash_algorithms[index]
+                integrity_report['inclusion_proof'] = [node.hex() for node in proof]
+            
+            return web.Response(
+                body=_json_dumps(integrity_report),
+                content_type='application/json',
+                status=200
+            )
             
         except Exception as e:
             logger.error(f"Error handling integrity check: {e}")
@@ -261,6 +828,11 @@ class SecureLogServer:
         
         ssl_context = self.create_ssl_context()
         
+        self._integrity_queue = asyncio.Queue()
+        self._integrity_lock = asyncio.Lock()
+        writer_task = asyncio.create_task(self._integrity_writer())
+        compaction_task = asyncio.create_task(self._integrity_compaction_loop())
+        
         runner = web.AppRunner(app)
         await runner.setup()
         
@@ -280,10 +852,24 @@ class SecureLogServer:
         except KeyboardInterrupt:
             logger.info("Shutting down server...")
         finally:
+            compaction_task.cancel()
             await runner.cleanup()
+            
+            # Holding the lock guarantees no WAL batch is mid-write
+            async with self._integrity_lock:
+                writer_task.cancel()
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self._compact_integrity_db
+                )
+            
+            if self.verify_pool is not None:
+                self.verify_pool.shutdown()
 
 def main():
     """Main entry point."""
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    
     server = SecureLogServer()
     asyncio.run(server.start_server())
 
@@ -68,7 +68,7 @@ setup_tuf_metadata_structure() {
     
     # Install Python TUF library
     python3 -m pip install --upgrade pip
-    python3 -m pip install tuf[ed25519] cryptography requests sigstore
+    python3 -m pip install tuf[ed25519] cryptography requests sigstore orjson
     
     # Create TUF key generation script
     cat > /usr/local/bin/tuf/generate-tuf-keys.py << 'EOF'
@@ -7,15 +7,54 @@ Requirement 8.5: Staged rollouts with canary testing
 """
 
 import os
+import asyncio
+import bisect
 import json
 import sys
 import time
-import subprocess
+import socket
+from collections import Counter
 from pathlib import Path
 from datetime import datetime, timedelta
 import hashlib
 import random
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _json_dumps(obj, indent=False):
+    """Serialize an object to JSON bytes, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None).encode('utf-8')
+
+def _json_loads(data):
+    """Deserialize JSON bytes, using orjson when available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Number of health reports retained for the active rollout
+HEALTH_REPORT_HISTORY = 100
+
+def _read_proc_file(path, size=2048):
+    """Read the head of a /proc file with a single pread"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.pread(fd, size, 0)
+    finally:
+        os.close(fd)
+
+def _meminfo_value(meminfo, field):
+    """Extract a kB value for a field such as b"MemTotal:" from /proc/meminfo bytes"""
+    start = meminfo.find(field)
+    if start < 0:
+        return None
+    start += len(field)
+    return int(meminfo[start:start + 32].split()[0])
+
 class StagedRolloutManager:
     def __init__(self, config_dir="/etc/tuf/rollout"):
         self.config_dir = Path(config_dir)
@@ -24,6 +63,8 @@ class StagedRolloutManager:
         # Rollout configuration
         self.rollout_config_file = self.config_dir / "rollout-config.json"
         self.rollout_state_file = self.config_dir / "rollout-state.json"
+        self.health_log_file = self.config_dir / "rollout-health.jsonl"
+        self._health_log_lines = 0
         
         # Default rollout stages
         self.default_stages = [
@@ -34,12 +75,15 @@ class StagedRolloutManager:
         ]
         
         self.load_config()
+        
+        # System ID is invariant for the lifetime of the process
+        self._system_id = self._compute_system_id()
     
     def load_config(self):
         """Load rollout configuration"""
         if self.rollout_config_file.exists():
-            with open(self.rollout_config_file, 'r') as f:
-                self.config = json.load(f)
+            with open(self.rollout_config_file, 'rb') as f:
+                self.config = _json_loads(f.read())
         else:
             self.config = {
                 "stages": self.default_stages,
@@ -54,25 +98,94 @@ class StagedRolloutManager:
                 }
             }
             self.save_config()
+        
+        self._compute_stage_bounds()
+    
+    def _compute_stage_bounds(self):
+        """Precompute cumulative stage end times for stage lookup"""
+        self._stage_end_hours = []
+        cumulative_hours = 0
+        
+        for stage in self.config["stages"]:
+            if stage["duration_hours"] == 0:
+                # Open-ended stage, later stages are never reached
+                self._stage_end_hours.append(float("inf"))
+                break
+            
+            cumulative_hours += stage["duration_hours"]
+            self._stage_end_hours.append(cumulative_hours)
     
     def save_config(self):
         """Save rollout configuration"""
-        with open(self.rollout_config_file, 'w') as f:
-            json.dump(self.config, f, indent=2)
+        with open(self.rollout_config_file, 'wb') as f:
+            f.write(_json_dumps(self.config, indent=True))
     
     def load_rollout_state(self):
         """Load current rollout state"""
-        if self.rollout_state_file.exists():
-            with open(self.rollout_state_file, 'r') as f:
-                return json.load(f)
-        return None
+        if not self.rollout_state_file.exists():
+            return None
+        
+        with open(self.rollout_state_file, 'rb') as f:
+            state = _json_loads(f.read())
+        
+        health_reports = self._load_health_reports()
+        
+        # Migrate reports embedded in the state file by older versions
+        legacy_reports = state.get("health_reports")
+        if legacy_reports:
+            health_reports = legacy_reports + health_reports
+            self._rewrite_health_log(health_reports[-HEALTH_REPORT_HISTORY:])
+            self.save_rollout_state(state)
+        
+        state["health_reports"] = health_reports[-HEALTH_REPORT_HISTORY:]
+        return state
     
     def save_rollout_state(self, state):
-        """Save rollout state"""
-        with open(self.rollout_state_file, 'w') as f:
-            json.dump(state, f, indent=2)
+        """Save rollout state (health reports are kept in the health log)"""
+        state = {key: value for key, value in state.items() if key != "health_reports"}
+        with open(self.rollout_state_file, 'wb') as f:
+            f.write(_json_dumps(state, indent=True))
+    
+    def _load_health_reports(self):
+        """Load health reports from the append-only health log"""
+        reports = []
+        if self.health_log_file.exists():
+            with open(self.health_log_file, 'rb') as f:
+                for line in f:
+                    try:
+                        reports.append(_json_loads(line))
+                    except ValueError:
+                        # Skip a torn line; reports after it are still valid
+                        continue
+        
+        self._health_log_lines = len(reports)
+        return reports
+    
+    def _append_health_report(self, health_results):
+        """Append a single health report to the health log"""
+        record = _json_dumps(health_results) + b'\n'
+        with open(self.health_log_file, 'a+b') as f:
+            # Never glue a report onto a torn line left by an earlier append
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    record = b'\n' + record
+            f.write(record)
+        self._health_log_lines += 1
+    
+    def _rewrite_health_log(self, reports):
+        """Replace the health log with the given reports"""
+        tmp_file = self.health_log_file.with_name(self.health_log_file.name + ".new")
+        with open(tmp_file, 'wb') as f:
+            f.write(b''.join(_json_dumps(report) + b'\n' for report in reports))
+        os.replace(tmp_file, self.health_log_file)
+        self._health_log_lines = len(reports)
     
     def get_system_id(self):
+        """Get consistent system ID for rollout selection"""
+        return self._system_id
+    
+    def _compute_system_id(self):
         """Generate consistent system ID for rollout selection"""
         # Use machine ID or generate from hardware info
         machine_id_file = Path("/etc/machine-id")
@@ -81,7 +194,7 @@ class StagedRolloutManager:
                 machine_id = f.read().strip()
         else:
             # Fallback: generate from hostname and other system info
-            hostname = subprocess.check_output(['hostname']).decode().strip()
+            hostname = socket.gethostname()
             machine_id = hashlib.sha256(hostname.encode()).hexdigest()
         
         return machine_id
@@ -90,123 +203,146 @@ class StagedRolloutManager:
         """Calculate which rollout group this system belongs to"""
         # Create deterministic hash from update ID and system ID
         combined = f"{update_id}:{system_id}"
-        hash_value = hashlib.sha256(combined.encode()).hexdigest()
+        digest = hashlib.sha256(combined.encode()).digest()
         
-        # Convert to percentage (0-99)
-        percentage = int(hash_value[:8], 16) % 100
+        # Convert leading 32 bits to percentage (0-99)
+        percentage = int.from_bytes(digest[:4], 'big') % 100
         
         return percentage
     
-    def get_current_stage(self, rollout_percentage, rollout_start_time):
+    def get_current_stage(self, rollout_start_time):
         """Determine current rollout stage based on time and configuration"""
         current_time = datetime.utcnow()
         elapsed_hours = (current_time - rollout_start_time).total_seconds() / 3600
         
-        cumulative_percentage = 0
-        cumulative_hours = 0
-        
-        for stage in self.config["stages"]:
-            cumulative_percentage = stage["percentage"]
-            cumulative_hours += stage["duration_hours"]
-            
-            # Check if we're in this stage's time window and percentage
-            if (elapsed_hours <= cumulative_hours or stage["duration_hours"] == 0) and \
-               rollout_percentage < cumulative_percentage:
-                return stage
+        return self._stage_at(elapsed_hours)
+    
+    def _stage_at(self, elapsed_hours):
+        """Find the stage whose time window contains elapsed_hours"""
+        index = bisect.bisect_left(self._stage_end_hours, elapsed_hours)
         
-        # Default to full rollout if we've passed all stages
-        return self.config["stages"][-1]
+        # Default to the last reachable stage once all windows have passed
+        return self.config["stages"][min(index, len(self._stage_end_hours) - 1)]
     
     def check_system_health(self):
         """Perform system health checks"""
+        return asyncio.run(self.check_system_health_async())
+    
+    async def check_system_health_async(self):
+        """Perform system health checks concurrently"""
         health_results = {
             "timestamp": datetime.utcnow().isoformat() + "Z",
             "checks": {},
             "overall_status": "healthy"
         }
         
-        # Check 1: System load
+        # The services probe is started first so systemctl runs while the
+        # in-process probes complete; wall-clock time is the slowest probe
+        critical_services, load_average, disk_space, memory_usage = await asyncio.gather(
+            self._check_critical_services(),
+            self._check_load_average(),
+            self._check_disk_space(),
+            self._check_memory_usage()
+        )
+        
+        for name, check in [
+            ("load_average", load_average),
+            ("disk_space", disk_space),
+            ("memory_usage", memory_usage),
+            ("critical_services", critical_services)
+        ]:
+            if check is not None:
+                health_results["checks"][name] = check
+        
+        # Determine overall status
+        check_statuses = [check.get("status", "unknown") for check in health_results["checks"].values()]
+        
+        if "critical" in check_statuses:
+            health_results["overall_status"] = "critical"
+        elif "warning" in check_statuses:
+            health_results["overall_status"] = "warning"
+        elif "unknown" in check_statuses:
+            health_results["overall_status"] = "unknown"
+        else:
+            health_results["overall_status"] = "healthy"
+        
+        return health_results
+    
+    async def _check_load_average(self):
+        """Check 1: System load"""
         try:
-            with open('/proc/loadavg', 'r') as f:
-                load_avg = float(f.read().split()[0])
+            load_avg = float(_read_proc_file('/proc/loadavg', 64).split(None, 1)[0])
             
-            health_results["checks"]["load_average"] = {
+            return {
                 "value": load_avg,
                 "status": "healthy" if load_avg < 2.0 else "warning" if load_avg < 5.0 else "critical"
             }
         except:
-            health_results["checks"]["load_average"] = {"status": "unknown"}
-        
-        # Check 2: Disk space
+            return {"status": "unknown"}
+    
+    async def _check_disk_space(self):
+        """Check 2: Disk space"""
         try:
-            result = subprocess.run(['df', '/'], capture_output=True, text=True)
-            if result.returncode == 0:
-                lines = result.stdout.strip().split('\n')
-                if len(lines) > 1:
-                    fields = lines[1].split()
-                    used_percent = int(fields[4].rstrip('%'))
-                    
-                    health_results["checks"]["disk_space"] = {
-                        "used_percent": used_percent,
-                        "status": "healthy" if used_percent < 80 else "warning" if used_percent < 95 else "critical"
-                    }
+            stat = os.statvfs('/')
+            used_blocks = stat.f_blocks - stat.f_bfree
+            usable_blocks = used_blocks + stat.f_bavail
+            # Same rounding as df's Use% column
+            used_percent = -(-used_blocks * 100 // usable_blocks) if usable_blocks else 0
+            
+            return {
+                "used_percent": used_percent,
+                "status": "healthy" if used_percent < 80 else "warning" if used_percent < 95 else "critical"
+            }
         except:
-            health_results["checks"]["disk_space"] = {"status": "unknown"}
-        
-        # Check 3: Memory usage
+            return {"status": "unknown"}
+    
+    async def _check_memory_usage(self):
+        """Check 3: Memory usage"""
         try:
-            with open('/proc/meminfo', 'r') as f:
-                meminfo = f.read()
-            
-            mem_total = None
-            mem_available = None
-            
-            for line in meminfo.split('\n'):
-                if line.startswith('MemTotal:'):
-                    mem_total = int(line.split()[1])
-                elif line.startswith('MemAvailable:'):
-                    mem_available = int(line.split()[1])
+            # MemTotal and MemAvailable are within the first few lines
+            meminfo = _read_proc_file('/proc/meminfo')
+            mem_total = _meminfo_value(meminfo, b"MemTotal:")
+            mem_available = _meminfo_value(meminfo, b"MemAvailable:")
             
             if mem_total and mem_available:
                 used_percent = ((mem_total - mem_available) / mem_total) * 100
                 
-                health_results["checks"]["memory_usage"] = {
+                return {
                     "used_percent": round(used_percent, 2),
                     "status": "healthy" if used_percent < 80 else "warning" if used_percent < 95 else "critical"
                 }
         except:
-            health_results["checks"]["memory_usage"] = {"status": "unknown"}
+            return {"status": "unknown"}
         
-        # Check 4: Critical services
+        return None
+    
+    async def _check_critical_services(self):
+        """Check 4: Critical services"""
         critical_services = ["systemd", "networkd", "nftables"]
         service_status = {}
         
-        for service in critical_services:
-            try:
-                result = subprocess.run(['systemctl', 'is-active', service], 
-                                      capture_output=True, text=True)
-                service_status[service] = "active" if result.returncode == 0 else "inactive"
-            except:
+        # A single systemctl call reports one state per line, in argument order
+        try:
+            process = await asyncio.create_subprocess_exec(
+                'systemctl', 'is-active', *critical_services,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+            stdout, _ = await process.communicate()
+            states = stdout.decode().split()
+            if len(states) != len(critical_services):
+                raise ValueError("unexpected systemctl output")
+            
+            for service, state in zip(critical_services, states):
+                service_status[service] = "active" if state == "active" else "inactive"
+        except:
+            for service in critical_services:
                 service_status[service] = "unknown"
         
-        health_results["checks"]["critical_services"] = {
+        return {
             "services": service_status,
             "status": "healthy" if all(s == "active" for s in service_status.values()) else "critical"
         }
-        
-        # Determine overall status
-        check_statuses = [check.get("status", "unknown") for check in health_results["checks"].values()]
-        
-        if "critical" in check_statuses:
-            health_results["overall_status"] = "critical"
-        elif "warning" in check_statuses:
-            health_results["overall_status"] = "warning"
-        elif "unknown" in check_statuses:
-            health_results["overall_status"] = "unknown"
-        else:
-            health_results["overall_status"] = "healthy"
-        
-        return health_results
     
     def should_receive_update(self, update_id):
         """Determine if this system should receive the update based on rollout stage"""
@@ -222,7 +358,7 @@ class StagedRolloutManager:
             return False, None
         
         rollout_start_time = datetime.fromisoformat(rollout_state["start_time"].rstrip('Z'))
-        current_stage = self.get_current_stage(rollout_percentage, rollout_start_time)
+        current_stage = self.get_current_stage(rollout_start_time)
         
         # Check if system is in current rollout group
         eligible = rollout_percentage < current_stage["percentage"]
@@ -247,6 +383,7 @@ class StagedRolloutManager:
         }
         
         self.save_rollout_state(rollout_state)
+        self._rewrite_health_log([])
         
         print(f"Started rollout for update: {update_id}")
         print(f"Rollout stages: {len(self.config['stages'])}")
@@ -266,13 +403,14 @@ class StagedRolloutManager:
         # Perform health check
         health_results = self.check_system_health()
         
-        # Add to rollout state
+        # Add to rollout state and append to the health log
         rollout_state["health_reports"].append(health_results)
+        rollout_state["health_reports"] = rollout_state["health_reports"][-HEALTH_REPORT_HISTORY:]
+        self._append_health_report(health_results)
         
-        # Keep only recent reports (last 100)
-        rollout_state["health_reports"] = rollout_state["health_reports"][-100:]
-        
-        self.save_rollout_state(rollout_state)
+        # Keep only recent reports once the log has grown well past the history
+        if self._health_log_lines > 2 * HEALTH_REPORT_HISTORY:
+            self._rewrite_health_log(rollout_state["health_reports"])
         
         print(f"Health report submitted: {health_results['overall_status']}")
         
@@ -289,8 +427,8 @@ class StagedRolloutManager:
         if len(recent_reports) < 5:
             return  # Not enough data
         
-        critical_count = sum(1 for report in recent_reports if report["overall_status"] == "critical")
-        failure_rate = (critical_count / len(recent_reports)) * 100
+        status_counts = Counter(report["overall_status"] for report in recent_reports)
+        failure_rate = (status_counts["critical"] / len(recent_reports)) * 100
         
         failure_threshold = self.config["health_checks"]["failure_threshold"]
         
@@ -327,26 +465,17 @@ class StagedRolloutManager:
         elapsed_hours = (current_time - rollout_start_time).total_seconds() / 3600
         
         # Find current stage
-        current_stage = None
-        cumulative_hours = 0
-        
-        for stage in self.config["stages"]:
-            cumulative_hours += stage["duration_hours"]
-            if elapsed_hours <= cumulative_hours or stage["duration_hours"] == 0:
-                current_stage = stage
-                break
-        
-        if not current_stage:
-            current_stage = self.config["stages"][-1]
+        current_stage = self._stage_at(elapsed_hours)
         
         # Health summary
         recent_reports = rollout_state["health_reports"][-10:]
+        status_counts = Counter(r["overall_status"] for r in recent_reports)
         health_summary = {
             "total_reports": len(rollout_state["health_reports"]),
             "recent_reports": len(recent_reports),
-            "healthy_count": sum(1 for r in recent_reports if r["overall_status"] == "healthy"),
-            "warning_count": sum(1 for r in recent_reports if r["overall_status"] == "warning"),
-            "critical_count": sum(1 for r in recent_reports if r["overall_status"] == "critical")
+            "healthy_count": status_counts["healthy"],
+            "warning_count": status_counts["warning"],
+            "critical_count": status_counts["critical"]
         }
         
         return {
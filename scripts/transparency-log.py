@@ -7,10 +7,18 @@ Requirement 9.5: Releases recorded in transparency log
 """
 
 import os
+import atexit
+import bisect
+import concurrent.futures
+import itertools
 import json
+import mmap
+import re
 import sys
 import hashlib
+import hmac
 import time
+from array import array
 from pathlib import Path
 from datetime import datetime
 import requests
@@ -18,19 +26,333 @@ from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import ed25519
 from cryptography.hazmat.primitives.serialization import load_pem_private_key
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson output that can differ from json.dumps: exponent-form and tiny
+# floats, and null (orjson writes NaN/Infinity as null)
+_ORJSON_MISMATCH = re.compile(rb'(?:^|[:,\[])(?:-?\d+(?:\.\d+)?[eE]|-?0\.0000|null)')
+
+def _canonical(obj):
+    """Serialize to canonical JSON bytes (sorted keys, compact, ASCII-only).
+    
+    Output is byte-identical to json.dumps(sort_keys=True, separators=(',', ':')),
+    which existing hashes and signatures depend on. orjson is used whenever it
+    renders the same bytes; anything it might render differently falls back.
+    """
+    if orjson is not None:
+        try:
+            data = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            data = None
+        if data is not None and data.isascii() and b'\x7f' not in data and not _ORJSON_MISMATCH.search(data):
+            return data
+    return json.dumps(obj, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+# Entries per worker task when rebuilding leaf hashes
+LEAF_HASH_BATCH = 1024
+
+# Integers wider than 64 bits, which orjson silently decodes as floats
+_ORJSON_BIGINT = re.compile(rb'[:,\[]\s*-?\d{19}')
+
+def _json_loads(data):
+    """Deserialize JSON bytes, using orjson when it decodes identically"""
+    if orjson is not None and not _ORJSON_BIGINT.search(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+# On OpenSSL builds hashlib.sha256 is the OpenSSL constructor, which uses
+# SHA-NI at runtime when the CPU supports it
+_sha256 = hashlib.sha256
+
+# Hash states with the RFC 6962 domain prefix already absorbed; copying
+# one is cheaper than building the prefixed input for every hash
+_LEAF_SEED = _sha256(b'\x00')
+_INTERNAL_SEED = _sha256(b'\x01')
+
+def sha256_leaf(data):
+    """Hash a leaf node (RFC 6962 0x00 prefix)"""
+    h = _LEAF_SEED.copy()
+    h.update(data)
+    return h.digest()
+
+def sha256_internal(left_hash, right_hash):
+    """Hash an internal node (RFC 6962 0x01 prefix)"""
+    h = _INTERNAL_SEED.copy()
+    h.update(left_hash)
+    h.update(right_hash)
+    return h.digest()
+
+def sha256_many(prefix, inputs):
+    """Hash a batch of independent inputs sharing a domain prefix"""
+    seed = _sha256(prefix)
+    digests = []
+    for data in inputs:
+        h = seed.copy()
+        h.update(data)
+        digests.append(h.digest())
+    return digests
+
+def sha256_level(level, pad=True):
+    """Hash a packed level of 32-byte nodes into its packed parent level
+    
+    With pad, an odd last node is paired with itself; otherwise it is
+    dropped, leaving only complete parents.
+    """
+    if len(level) % 64:
+        # Odd number of nodes, duplicate the last one
+        level = level + level[-32:] if pad else level[:-32]
+    
+    view = memoryview(level)
+    return b''.join(sha256_many(b'\x01', [view[i:i + 64] for i in range(0, len(level), 64)]))
+
+def _sorted_intersection(first, second):
+    """Yield values present in both ascending lists, in order"""
+    smaller, larger = sorted((first, second), key=len)
+    for value in smaller:
+        position = bisect.bisect_left(larger, value)
+        if position < len(larger) and larger[position] == value:
+            yield value
+
+class IncrementalMerkleTree:
+    """Merkle tree frontier supporting O(log n) appends.
+    
+    The frontier holds the root of each complete subtree, largest first,
+    one per set bit of size. The root matches build_merkle_tree, which
+    pairs the last node of an odd-sized level with itself.
+    """
+    
+    def __init__(self, internal_hash, frontier=None, size=0):
+        self.internal_hash = internal_hash
+        self.frontier = list(frontier or [])
+        self.size = size
+    
+    def append(self, leaf_hash):
+        """Append a leaf hash, merging completed subtrees
+        
+        Returns the newly completed internal nodes, one per level from 1 up.
+        """
+        node = leaf_hash
+        size = self.size
+        completed = []
+        while size & 1:
+            node = self.internal_hash(self.frontier.pop(), node)
+            completed.append(node)
+            size >>= 1
+        self.frontier.append(node)
+        self.size += 1
+        return completed
+    
+    def right_spine(self):
+        """Hashes of the incomplete rightmost node at each level
+        
+        Levels whose rightmost node covers a full subtree are omitted; the
+        entry for the top level is the root.
+        """
+        spine = {}
+        if not self.size:
+            return spine
+        
+        # Map frontier entries to the tree level they sit at
+        levels = [k for k in range(self.size.bit_length() - 1, -1, -1) if self.size >> k & 1]
+        subtrees = dict(zip(levels, self.frontier))
+        
+        lowest = levels[-1]
+        current = subtrees[lowest]
+        level = lowest
+        while (1 << level) < self.size:
+            if level in subtrees and level != lowest:
+                current = self.internal_hash(subtrees[level], current)
+            else:
+                # Odd number of nodes, duplicate the last one
+                current = self.internal_hash(current, current)
+            level += 1
+            spine[level] = current
+        
+        return spine
+    
+    def root(self):
+        """Calculate the root hash of the current tree"""
+        if not self.size:
+            return None
+        
+        spine = self.right_spine()
+        return spine[max(spine)] if spine else self.frontier[0]
+
+class _LazyEntries:
+    """Log entries decoded on demand from a memory-mapped entries.jsonl.
+    
+    Line start offsets are kept in an offsets.bin sidecar, so opening the
+    log parses no JSON.
+    """
+    
+    def __init__(self, entries_file, offsets_file, read_only=False):
+        self.entries_file = Path(entries_file)
+        self.offsets_file = Path(offsets_file)
+        self.read_only = read_only
+        self.offsets = array('Q')
+        self.end = 0
+        self._mmap = None
+        self._entries_fp = None
+        self._offsets_fp = None
+        self._load_offsets()
+    
+    def _buffer(self):
+        """Return the mapped entries file, remapping it after appends"""
+        if not self.end:
+            return b''
+        if self._mmap is None or len(self._mmap) < self.end:
+            if self._mmap is not None:
+                self._mmap.close()
+            with open(self.entries_file, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+    
+    def _load_offsets(self):
+        """Load line offsets, indexing any lines the sidecar is missing"""
+        stored = self.offsets_file.read_bytes() if self.offsets_file.exists() else b''
+        self.offsets.frombytes(stored[:len(stored) - len(stored) % self.offsets.itemsize])
+        self.end = self.entries_file.stat().st_size if self.entries_file.exists() else 0
+        buf = self._buffer()
+        
+        # Drop offsets that no longer start a line
+        while self.offsets and (self.offsets[-1] >= self.end or
+                                (self.offsets[-1] and buf[self.offsets[-1] - 1] != ord('\n'))):
+            self.offsets.pop()
+        
+        pos = 0
+        if self.offsets:
+            newline = buf.find(b'\n', self.offsets[-1])
+            pos = self.end if newline < 0 else newline + 1
+        
+        while pos < self.end:
+            newline = buf.find(b'\n', pos)
+            line_end = self.end if newline < 0 else newline + 1
+            if buf[pos:line_end].strip():
+                self.offsets.append(pos)
+            pos = line_end
+        
+        if self.offsets.tobytes() != stored and not self.read_only:
+            with open(self.offsets_file, 'wb') as f:
+                self.offsets.tofile(f)
+    
+    def __len__(self):
+        return len(self.offsets)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Log index out of range")
+        
+        start = self.offsets[index]
+        end = self.offsets[index + 1] if index + 1 < len(self) else self.end
+        return _json_loads(self._buffer()[start:end])
+    
+    def __iter__(self):
+        return self.iter_range(0, len(self))
+    
+    def iter_range(self, start, stop):
+        """Decode entries[start:stop] lazily as they are consumed"""
+        for index in range(start, stop):
+            yield self[index]
+    
+    def append(self, line):
+        """Append a serialized entry line to entries.jsonl"""
+        if self._entries_fp is None:
+            self._entries_fp = open(self.entries_file, 'ab', buffering=0)
+            self._offsets_fp = open(self.offsets_file, 'ab', buffering=0)
+        
+        offset = self.end
+        self._entries_fp.write(line)
+        self._offsets_fp.write(array('Q', [offset]).tobytes())
+        
+        self.offsets.append(offset)
+        self.end += len(line)
+    
+    def close(self):
+        """Close the append handles and the mapping"""
+        for fp in (self._entries_fp, self._offsets_fp, self._mmap):
+            if fp is not None:
+                fp.close()
+        self._entries_fp = self._offsets_fp = self._mmap = None
+
+class _PackedHashes:
+    """Read-only sequence of 32-byte hashes over a memory-mapped packed file"""
+    
+    def __init__(self, path):
+        self._count = path.stat().st_size // 32 if path.exists() else 0
+        self._buffer = b''
+        if self._count:
+            with open(path, 'rb') as f:
+                self._buffer = mmap.mmap(f.fileno(), self._count * 32, access=mmap.ACCESS_READ)
+    
+    def __len__(self):
+        return self._count
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("Leaf index out of range")
+        
+        return self._buffer[index * 32:(index + 1) * 32]
+    
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
 class TransparencyLog:
-    def __init__(self, log_dir="/var/lib/tuf/transparency-log"):
+    def __init__(self, log_dir="/var/lib/tuf/transparency-log", hash_only=False):
         self.log_dir = Path(log_dir)
         self.log_dir.mkdir(parents=True, exist_ok=True)
         
         # Log files
         self.entries_file = self.log_dir / "entries.jsonl"
+        self.leaves_file = self.log_dir / "leaves.bin"
+        self.offsets_file = self.log_dir / "offsets.bin"
+        self.levels_dir = self.log_dir / "levels"
+        self.levels_dir.mkdir(exist_ok=True)
         self.merkle_tree_file = self.log_dir / "merkle-tree.json"
         self.log_config_file = self.log_dir / "config.json"
         
+        # Hash-only readers serve roots and proofs from the hash files and
+        # never touch entries.jsonl unless entry content is requested. When
+        # the hash files do not cover every entry (e.g. a log written before
+        # they existed, or an append in progress) the missing hashes are
+        # computed in memory; readers never write to the log.
+        self.read_only = hash_only
+        self.hash_only = hash_only and self.hash_files_complete()
+        
+        # Append handles for the packed hash files, opened on first use
+        self._hash_fps = {}
+        
+        # Level hashes computed in memory when the level files are incomplete
+        self._levels = None
+        
+        # Search indexes (entry_type / update_id -> log indexes), built on first search
+        self._by_type = None
+        self._by_update = None
+        
         # Initialize log
         self.load_config()
-        self.log_entries = self.load_entries()
+        self._log_entries = None if self.hash_only else self.load_entries()
+        self._leaf_hashes = self.load_leaf_hashes()
+        self._frontier = self.load_frontier()
+        
+        # Persist any pending checkpoint on exit
+        atexit.register(self.close)
         
     def load_config(self):
         """Load transparency log configuration"""
@@ -43,9 +365,11 @@ class TransparencyLog:
                 "created_at": datetime.utcnow().isoformat() + "Z",
                 "description": "Hardened OS Update Transparency Log",
                 "public_key": None,
-                "tree_size": 0
+                "tree_size": 0,
+                "checkpoint_interval": 100
             }
-            self.save_config()
+            if not self.read_only:
+                self.save_config()
     
     def save_config(self):
         """Save transparency log configuration"""
@@ -60,30 +384,182 @@ class TransparencyLog:
         return hashlib.sha256(combined.encode()).hexdigest()[:32]
     
     def load_entries(self):
-        """Load existing log entries"""
-        entries = []
-        if self.entries_file.exists():
-            with open(self.entries_file, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        entries.append(json.loads(line))
-        return entries
+        """Load existing log entries (decoded lazily on access)"""
+        return _LazyEntries(self.entries_file, self.offsets_file, read_only=self.read_only)
+    
+    @property
+    def log_entries(self):
+        """Log entries, opened on first use in hash-only mode"""
+        if self._log_entries is None:
+            self._log_entries = self.load_entries()
+        return self._log_entries
+    
+    def load_leaf_hashes(self):
+        """Load cached leaf hashes, rebuilding any missing from the entries"""
+        if self.hash_only:
+            return _PackedHashes(self.leaves_file)
+        
+        data = self.leaves_file.read_bytes() if self.leaves_file.exists() else b''
+        
+        count = min(len(data) // 32, len(self.log_entries))
+        leaf_hashes = [data[i * 32:(i + 1) * 32] for i in range(count)]
+        
+        if len(data) != len(self.log_entries) * 32:
+            # Recover from a missing, short or torn leaves file
+            leaf_hashes.extend(self._hash_leaves_parallel(count, len(self.log_entries)))
+            if not self.read_only:
+                with open(self.leaves_file, 'wb') as f:
+                    f.write(b''.join(leaf_hashes))
+        
+        return leaf_hashes
+    
+    def level_file(self, level):
+        """Path of the packed hash file for a tree level (0 = leaves)"""
+        if level == 0:
+            return self.leaves_file
+        return self.levels_dir / f"{level}.bin"
+    
+    def hash_file(self, path):
+        """Return the persistent handle for a packed hash file"""
+        fp = self._hash_fps.get(path)
+        if fp is None:
+            fp = self._hash_fps[path] = open(path, 'rb' if self.read_only else 'a+b', buffering=0)
+        return fp
+    
+    def read_node(self, level, index):
+        """Read the complete subtree hash at (level, index)"""
+        if level == 0:
+            return self._leaf_hashes[index]
+        if self._levels is not None:
+            return self._levels[level - 1][index * 32:(index + 1) * 32]
+        
+        return os.pread(self.hash_file(self.level_file(level)).fileno(), 32, index * 32)
+    
+    def close_hash_files(self):
+        """Close the packed hash file handles"""
+        for fp in self._hash_fps.values():
+            fp.close()
+        self._hash_fps.clear()
+    
+    def compute_levels(self):
+        """Compute the packed complete-subtree hashes of each level above the leaves"""
+        levels = []
+        current_level = b''.join(self._leaf_hashes)
+        while len(current_level) >= 64:
+            current_level = sha256_level(current_level, pad=False)
+            levels.append(current_level)
+        return levels
+    
+    def rebuild_levels(self):
+        """Rebuild the per-level hash files from the leaf hashes"""
+        self.close_hash_files()
+        levels = self.compute_levels()
+        for level, current_level in enumerate(levels, 1):
+            with open(self.level_file(level), 'wb') as f:
+                f.write(current_level)
+        
+        # Remove levels left over from a larger tree
+        for path in self.levels_dir.glob("*.bin"):
+            if path.stem.isdigit() and int(path.stem) > len(levels):
+                path.unlink()
+    
+    def load_frontier(self):
+        """Load the Merkle frontier from the level files, rebuilding them if stale"""
+        size = len(self._leaf_hashes)
+        
+        if self.read_only and not self.hash_only:
+            # Another process may be appending to the level files
+            self._levels = self.compute_levels()
+        
+        # Level k holds one hash per complete 2^k-leaf subtree
+        level = 1
+        while size >> level and not self.read_only:
+            path = self.level_file(level)
+            if not path.exists() or path.stat().st_size != (size >> level) * 32:
+                print("Rebuilding Merkle tree level files")
+                self.rebuild_levels()
+                break
+            level += 1
+        
+        frontier = [self.read_node(k, (size >> k) - 1)
+                    for k in range(size.bit_length() - 1, -1, -1) if size >> k & 1]
+        return IncrementalMerkleTree(sha256_internal, frontier, size)
+    
+    def count_entries(self):
+        """Count entries from offsets.bin without parsing entries.jsonl
+        
+        Returns None if the sidecar is missing or does not index every line.
+        """
+        entries_size = self.entries_file.stat().st_size if self.entries_file.exists() else 0
+        offsets_size = self.offsets_file.stat().st_size if self.offsets_file.exists() else 0
+        if offsets_size % 8:
+            return None
+        
+        count = offsets_size // 8
+        if not count:
+            if entries_size and self.entries_file.read_bytes().strip():
+                return None
+            return 0
+        
+        with open(self.offsets_file, 'rb') as f:
+            last_offset = array('Q', os.pread(f.fileno(), 8, offsets_size - 8))[0]
+        if last_offset >= entries_size:
+            return None
+        
+        # Everything after the last indexed line must be blank
+        with open(self.entries_file, 'rb') as f:
+            tail = os.pread(f.fileno(), entries_size - last_offset, last_offset)
+        newline = tail.find(b'\n')
+        if newline >= 0 and tail[newline + 1:].strip():
+            return None
+        
+        return count
+    
+    def hash_files_complete(self):
+        """Check the leaf and level files cover every entry in the log"""
+        size = self.count_entries()
+        if size is None:
+            return False
+        
+        leaves_size = self.leaves_file.stat().st_size if self.leaves_file.exists() else 0
+        if leaves_size != size * 32:
+            return False
+        
+        level = 1
+        while size >> level:
+            path = self.level_file(level)
+            if not path.exists() or path.stat().st_size != (size >> level) * 32:
+                return False
+            level += 1
+        
+        return True
     
     def calculate_leaf_hash(self, entry_data):
         """Calculate leaf hash for Merkle tree"""
         # Create canonical JSON representation
-        canonical_json = json.dumps(entry_data, separators=(',', ':'), sort_keys=True)
+        canonical_json = _canonical(entry_data)
         
         # Hash with prefix for leaf nodes (RFC 6962 style)
-        leaf_prefix = b'\x00'  # 0x00 for leaf nodes
-        return hashlib.sha256(leaf_prefix + canonical_json.encode('utf-8')).digest()
+        return sha256_leaf(canonical_json)
+    
+    def calculate_leaf_hashes(self, entries):
+        """Calculate leaf hashes for a batch of entries"""
+        return sha256_many(b'\x00', [_canonical(e) for e in entries])
+    
+    def _hash_leaves_parallel(self, start, stop):
+        """Calculate leaf hashes for entries[start:stop] across worker threads"""
+        if stop - start <= LEAF_HASH_BATCH:
+            return self.calculate_leaf_hashes(self.log_entries[start:stop])
+        
+        batches = [self.log_entries.iter_range(i, min(i + LEAF_HASH_BATCH, stop))
+                   for i in range(start, stop, LEAF_HASH_BATCH)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+            return [h for batch in pool.map(self.calculate_leaf_hashes, batches) for h in batch]
     
     def calculate_internal_hash(self, left_hash, right_hash):
         """Calculate internal node hash for Merkle tree"""
         # Hash with prefix for internal nodes (RFC 6962 style)
-        internal_prefix = b'\x01'  # 0x01 for internal nodes
-        return hashlib.sha256(internal_prefix + left_hash + right_hash).digest()
+        return sha256_internal(left_hash, right_hash)
     
     def build_merkle_tree(self, leaf_hashes):
         """Build Merkle tree from leaf hashes"""
@@ -93,42 +569,38 @@ class TransparencyLog:
         if len(leaf_hashes) == 1:
             return leaf_hashes[0], [leaf_hashes[0]]
         
-        # Build tree bottom-up
-        current_level = leaf_hashes[:]
-        tree_levels = [current_level[:]]
+        # Build tree bottom-up over packed levels
+        current_level = b''.join(leaf_hashes)
+        tree_levels = [leaf_hashes[:]]
         
-        while len(current_level) > 1:
-            next_level = []
-            
-            # Process pairs
-            for i in range(0, len(current_level), 2):
-                left = current_level[i]
-                
-                if i + 1 < len(current_level):
-                    right = current_level[i + 1]
-                else:
-                    # Odd number of nodes, duplicate the last one
-                    right = left
-                
-                parent_hash = self.calculate_internal_hash(left, right)
-                next_level.append(parent_hash)
-            
-            tree_levels.append(next_level[:])
-            current_level = next_level
+        while len(current_level) > 32:
+            current_level = sha256_level(current_level)
+            tree_levels.append([current_level[i:i + 32] for i in range(0, len(current_level), 32)])
         
-        root_hash = current_level[0]
+        root_hash = current_level
         return root_hash, tree_levels
     
-    def create_inclusion_proof(self, entry_index, tree_levels):
-        """Create inclusion proof for an entry"""
-        if entry_index >= len(tree_levels[0]):
+    def create_inclusion_proof(self, entry_index):
+        """Create inclusion proof for an entry from the stored tree levels"""
+        tree_size = self._frontier.size
+        if entry_index < 0 or entry_index >= tree_size:
             raise ValueError("Entry index out of range")
         
+        # Incomplete right-edge nodes are not stored; derive them from the frontier
+        spine = self._frontier.right_spine()
+        
+        def node_hash(level, index):
+            if (index + 1) << level <= tree_size:
+                return self.read_node(level, index)
+            return spine[level]
+        
         proof = []
         current_index = entry_index
+        level = 0
+        level_size = tree_size
         
         # Traverse up the tree
-        for level in tree_levels[:-1]:  # Exclude root level
+        while level_size > 1:
             # Find sibling
             if current_index % 2 == 0:
                 # Left child, sibling is to the right
@@ -137,14 +609,20 @@ class TransparencyLog:
                 # Right child, sibling is to the left
                 sibling_index = current_index - 1
             
-            if sibling_index < len(level):
-                sibling_hash = level[sibling_index]
-                proof.append({
-                    "hash": sibling_hash.hex(),
-                    "is_right": current_index % 2 == 0
-                })
+            if sibling_index >= level_size:
+                # Odd number of nodes, the last one is paired with itself
+                sibling_index = current_index
+            
+            sibling_hash = node_hash(level, sibling_index)
+            proof.append({
+                "hash": sibling_hash.hex(),
+                "hash_bytes": sibling_hash,
+                "is_right": current_index % 2 == 0
+            })
             
             current_index = current_index // 2
+            level += 1
+            level_size = (level_size + 1) // 2
         
         return proof
     
@@ -154,57 +632,83 @@ class TransparencyLog:
         leaf_hash = self.calculate_leaf_hash(entry_data)
         current_hash = leaf_hash
         
-        # Apply proof steps
+        # Apply proof steps (raw hashes are present on locally generated proofs)
         for step in proof:
-            sibling_hash = bytes.fromhex(step["hash"])
+            sibling_hash = step.get("hash_bytes") or bytes.fromhex(step["hash"])
             
             if step["is_right"]:
                 # Sibling is right child
-                current_hash = self.calculate_internal_hash(current_hash, sibling_hash)
+                current_hash = sha256_internal(current_hash, sibling_hash)
             else:
                 # Sibling is left child
-                current_hash = self.calculate_internal_hash(sibling_hash, current_hash)
+                current_hash = sha256_internal(sibling_hash, current_hash)
         
-        return current_hash == root_hash
+        return hmac.compare_digest(current_hash, root_hash)
     
     def add_entry(self, entry_type, entry_data):
         """Add entry to transparency log"""
+        if self.read_only:
+            raise RuntimeError("Transparency log opened in hash-only mode is read-only")
+        
         # Create log entry
         entry = {
             "log_index": len(self.log_entries),
             "timestamp": datetime.utcnow().isoformat() + "Z",
             "entry_type": entry_type,
-            "data": entry_data,
-            "log_id": self.config["log_id"]
+            "data": entry_data
         }
         
-        # Add to entries list
-        self.log_entries.append(entry)
+        # Serialize once: the canonical form is both the stored line and
+        # the leaf hash input
+        canonical_json = _canonical(entry)
         
         # Append to entries file
-        with open(self.entries_file, 'a') as f:
-            f.write(json.dumps(entry) + '\n')
+        self.log_entries.append(canonical_json + b'\n')
+        
+        # Cache leaf hash and extend Merkle tree
+        leaf_hash = sha256_leaf(canonical_json)
+        self._leaf_hashes.append(leaf_hash)
+        self.hash_file(self.leaves_file).write(leaf_hash)
+        
+        for level, node in enumerate(self._frontier.append(leaf_hash), 1):
+            self.hash_file(self.level_file(level)).write(node)
         
-        # Rebuild Merkle tree
-        leaf_hashes = [self.calculate_leaf_hash(e) for e in self.log_entries]
-        root_hash, tree_levels = self.build_merkle_tree(leaf_hashes)
+        if self._by_type is not None:
+            self._index_entry(entry["log_index"], entry)
+        
+        # Persist tree size and root periodically rather than per entry
+        if self._frontier.size % self.config.get("checkpoint_interval", 100) == 0:
+            self.checkpoint()
+        
+        print(f"Added entry {entry['log_index']} to transparency log")
+        return entry
+    
+    def checkpoint(self):
+        """Persist the tree size and Merkle root"""
+        root_hash = self._frontier.root()
         
         # Update tree size
-        self.config["tree_size"] = len(self.log_entries)
+        self.config["tree_size"] = self._frontier.size
         self.save_config()
         
         # Save Merkle tree
         merkle_data = {
-            "tree_size": len(self.log_entries),
+            "tree_size": self._frontier.size,
             "root_hash": root_hash.hex() if root_hash else None,
             "timestamp": datetime.utcnow().isoformat() + "Z"
         }
         
         with open(self.merkle_tree_file, 'w') as f:
             json.dump(merkle_data, f, indent=2)
-        
-        print(f"Added entry {entry['log_index']} to transparency log")
-        return entry
+    
+    def close(self):
+        """Write a final checkpoint and release file handles"""
+        if not self.read_only and self.config["tree_size"] != self._frontier.size:
+            self.checkpoint()
+        
+        if self._log_entries is not None:
+            self._log_entries.close()
+        self.close_hash_files()
     
     def get_entry(self, log_index):
         """Get entry by log index"""
@@ -222,19 +726,16 @@ class TransparencyLog:
     
     def get_inclusion_proof(self, log_index):
         """Get inclusion proof for an entry"""
-        if log_index < 0 or log_index >= len(self.log_entries):
+        if log_index < 0 or log_index >= self._frontier.size:
             raise ValueError("Log index out of range")
         
-        # Rebuild Merkle tree
-        leaf_hashes = [self.calculate_leaf_hash(e) for e in self.log_entries]
-        root_hash, tree_levels = self.build_merkle_tree(leaf_hashes)
-        
-        # Create inclusion proof
-        proof = self.create_inclusion_proof(log_index, tree_levels)
+        # Create inclusion proof from the stored tree levels
+        root_hash = self._frontier.root()
+        proof = self.create_inclusion_proof(log_index)
         
         return {
             "log_index": log_index,
-            "tree_size": len(self.log_entries),
+            "tree_size": self._frontier.size,
             "root_hash": root_hash.hex(),
             "proof": proof
         }
@@ -294,47 +795,56 @@ class TransparencyLog:
     
     def calculate_metadata_hash(self, metadata):
         """Calculate hash of metadata for transparency log"""
-        canonical_json = json.dumps(metadata, separators=(',', ':'), sort_keys=True)
-        return hashlib.sha256(canonical_json.encode('utf-8')).hexdigest()
+        return _sha256(_canonical(metadata)).hexdigest()
     
     def get_log_info(self):
         """Get transparency log information"""
-        # Calculate current root hash
-        if self.log_entries:
-            leaf_hashes = [self.calculate_leaf_hash(e) for e in self.log_entries]
-            root_hash, _ = self.build_merkle_tree(leaf_hashes)
-            current_root = root_hash.hex() if root_hash else None
-        else:
-            current_root = None
+        # Current root hash from the frontier, O(log n)
+        root_hash = self._frontier.root()
+        current_root = root_hash.hex() if root_hash else None
         
         return {
             "log_id": self.config["log_id"],
             "description": self.config["description"],
             "created_at": self.config["created_at"],
-            "tree_size": len(self.log_entries),
+            "tree_size": self._frontier.size,
             "root_hash": current_root,
             "last_update": datetime.utcnow().isoformat() + "Z"
         }
     
+    def _index_entry(self, log_index, entry):
+        """Add an entry to the search indexes"""
+        self._by_type.setdefault(entry["entry_type"], []).append(log_index)
+        
+        update_id = entry["data"].get("update_id")
+        if update_id is not None:
+            self._by_update.setdefault(update_id, []).append(log_index)
+    
+    def build_search_indexes(self):
+        """Build the entry_type and update_id search indexes"""
+        self._by_type = {}
+        self._by_update = {}
+        for log_index, entry in enumerate(self.log_entries):
+            self._index_entry(log_index, entry)
+    
     def search_entries(self, entry_type=None, update_id=None, limit=100):
         """Search log entries"""
-        results = []
-        
-        for entry in self.log_entries:
-            # Filter by entry type
-            if entry_type and entry["entry_type"] != entry_type:
-                continue
-            
-            # Filter by update ID
-            if update_id and entry["data"].get("update_id") != update_id:
-                continue
-            
-            results.append(entry)
-            
-            if len(results) >= limit:
-                break
+        if self._by_type is None:
+            self.build_search_indexes()
+        
+        type_matches = self._by_type.get(entry_type, []) if entry_type else None
+        update_matches = self._by_update.get(update_id, []) if update_id else None
+        
+        if type_matches is not None and update_matches is not None:
+            candidates = _sorted_intersection(type_matches, update_matches)
+        elif type_matches is not None:
+            candidates = type_matches
+        elif update_matches is not None:
+            candidates = update_matches
+        else:
+            candidates = range(len(self.log_entries))
         
-        return results
+        return [self.log_entries[i] for i in itertools.islice(candidates, limit)]
 
 def main():
     """Main function for command line usage"""
@@ -351,8 +861,8 @@ def main():
         sys.exit(1)
     
     try:
-        log = TransparencyLog()
         command = sys.argv[1]
+        log = TransparencyLog(hash_only=command == "info")
         
         if command == "info":
             info = log.get_log_info()
